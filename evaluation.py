@@ -8,26 +8,76 @@ Author: Shovon Paul
 Date: 2024-11-17
 """
 
+import argparse
 import asyncio
+import math
 import time
 from typing import List, Dict, Tuple
-import statistics
+import numpy as np
+import pandas as pd
+from aiolimiter import AsyncLimiter
 from services.chatgpt import get_shodan_query
 from services.shodan import execute_shodan_query
-from services.vulnSolution import get_security_solutions
-import json
+from services.vulnSolution import get_security_solutions, SYSTEMS_PER_PROMPT
+import orjson
+import aiofiles
 from datetime import datetime
-import csv
 from pathlib import Path
+from dataclasses import dataclass
 
-class TimingResult:
-    def __init__(self, total: float, chatgpt: float, shodan: float, solution: float):
-        self.total = total
-        self.chatgpt = chatgpt
-        self.shodan = shodan
-        self.solution = solution
+# Upstream rate limits; requests only wait once the budget is used up
+OPENAI_LIMITER = AsyncLimiter(max_rate=500, time_period=60)
+SHODAN_LIMITER = AsyncLimiter(max_rate=1, time_period=1)
 
-async def measure_query_performance(query: str, limit: int = 5) -> TimingResult:
+@dataclass
+class TimingResults:
+    """
+    Struct-of-arrays store for timing measurements, one column per component.
+    Durations are kept as raw int64 nanoseconds and converted on output.
+    """
+    total: np.ndarray
+    chatgpt: np.ndarray
+    shodan: np.ndarray
+    solution: np.ndarray
+    count: int = 0
+
+    @classmethod
+    def allocate(cls, capacity: int) -> "TimingResults":
+        """
+        Preallocate storage for a fixed number of measurements.
+
+        Args:
+            capacity (int): Maximum number of measurements to store
+
+        Returns:
+            TimingResults: Empty result store
+        """
+        return cls(*(np.empty(capacity, dtype=np.int64) for _ in range(4)))
+
+    def add(self, total: int, chatgpt: int, shodan: int, solution: int) -> None:
+        """
+        Record one measurement, in nanoseconds, in the next free row.
+        """
+        row = self.count
+        self.total[row] = total
+        self.chatgpt[row] = chatgpt
+        self.shodan[row] = shodan
+        self.solution[row] = solution
+        self.count += 1
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        Return the recorded rows in seconds, keyed by CSV column name.
+        """
+        n = self.count
+        return {
+            'Total Time': self.total[:n] * 1e-9,
+            'ChatGPT Time': self.chatgpt[:n] * 1e-9,
+            'Shodan Time': self.shodan[:n] * 1e-9,
+            'Solution Time': self.solution[:n] * 1e-9
+        }
+
+async def measure_query_performance(query: str, limit: int = 5) -> Tuple[int, int, int, int]:
     """
     Measure the performance of a single query execution.
     
@@ -36,90 +86,106 @@ async def measure_query_performance(query: str, limit: int = 5) -> TimingResult:
         limit (int): Number of results to retrieve
         
     Returns:
-        TimingResult: Timing measurements for different components
+        Tuple[int, int, int, int]: Total, ChatGPT, Shodan and solution times in nanoseconds
     """
-    start_total = time.time()
+    # Rate-limit capacity is reserved right before each upstream call, and the
+    # time spent waiting for it is excluded from every measurement
+    await OPENAI_LIMITER.acquire()
+    
+    start_total = time.perf_counter_ns()
     
     # Measure ChatGPT query generation
-    start_chatgpt = time.time()
-    chatgpt_response = await get_shodan_query(query)
-    chatgpt_time = time.time() - start_chatgpt
+    start_chatgpt = time.perf_counter_ns()
+    chatgpt_response = await get_shodan_query(query, use_cache=False)
+    chatgpt_time = time.perf_counter_ns() - start_chatgpt
     
-    # Measure Shodan query execution
-    start_shodan = time.time()
-    shodan_results = await execute_shodan_query(chatgpt_response['shodan_query'], limit)
-    shodan_time = time.time() - start_shodan
+    # Measure Shodan query execution, bypassing the result cache used by /query
+    start_wait = time.perf_counter_ns()
+    await SHODAN_LIMITER.acquire()
+    start_shodan = time.perf_counter_ns()
+    wait_time = start_shodan - start_wait
+    shodan_results = await execute_shodan_query.__wrapped__(chatgpt_response['shodan_query'], limit)
+    shodan_time = time.perf_counter_ns() - start_shodan
     
-    # Measure solution generation
-    start_solution = time.time()
+    # Measure solution generation: one combined request per SYSTEMS_PER_PROMPT results
+    solution_requests = math.ceil(len(shodan_results) / SYSTEMS_PER_PROMPT)
+    start_wait = time.perf_counter_ns()
+    if solution_requests:
+        await OPENAI_LIMITER.acquire(solution_requests)
+    start_solution = time.perf_counter_ns()
+    wait_time += start_solution - start_wait
     await get_security_solutions(shodan_results)
-    solution_time = time.time() - start_solution
+    solution_time = time.perf_counter_ns() - start_solution
     
-    total_time = time.time() - start_total
+    total_time = time.perf_counter_ns() - start_total - wait_time
     
-    return TimingResult(total_time, chatgpt_time, shodan_time, solution_time)
+    return total_time, chatgpt_time, shodan_time, solution_time
 
-async def run_evaluation(test_queries: List[str], iterations: int = 10) -> List[TimingResult]:
+async def run_evaluation(test_queries: List[str], iterations: int = 10, max_concurrency: int = 10) -> TimingResults:
     """
     Run performance evaluation on a set of test queries.
     
     Args:
         test_queries (List[str]): List of queries to test
         iterations (int): Number of times to run each query
+        max_concurrency (int): Maximum number of queries measured at once
         
     Returns:
-        List[TimingResult]: List of timing results
+        TimingResults: Timing results for all successful runs
     """
-    results = []
+    results = TimingResults.allocate(len(test_queries) * iterations)
+    semaphore = asyncio.Semaphore(max_concurrency)
     
-    for query in test_queries:
-        for _ in range(iterations):
+    async def run_single(query: str) -> None:
+        async with semaphore:
             try:
-                result = await measure_query_performance(query)
-                results.append(result)
-                # Add delay to avoid rate limiting
-                await asyncio.sleep(1)
+                results.add(*await measure_query_performance(query))
             except Exception as e:
                 print(f"Error processing query '{query}': {str(e)}")
     
+    # Run all iterations concurrently; the rate limiters smooth upstream bursts
+    await asyncio.gather(*(
+        run_single(query)
+        for query in test_queries
+        for _ in range(iterations)
+    ))
+    
     return results
 
-def analyze_results(results: List[TimingResult]) -> Dict:
+def analyze_results(results: TimingResults) -> Dict:
     """
     Analyze timing results and generate statistics.
     
     Args:
-        results (List[TimingResult]): List of timing measurements
+        results (TimingResults): Timing measurements
         
     Returns:
         Dict: Statistical analysis of results
     """
-    total_times = [r.total for r in results]
-    chatgpt_times = [r.chatgpt for r in results]
-    shodan_times = [r.shodan for r in results]
-    solution_times = [r.solution for r in results]
+    columns = results.columns()
+    total_times = columns['Total Time']
     
     return {
         "total": {
-            "mean": statistics.mean(total_times),
-            "median": statistics.median(total_times),
-            "std_dev": statistics.stdev(total_times) if len(total_times) > 1 else 0,
-            "min": min(total_times),
-            "max": max(total_times)
+            "mean": float(total_times.mean()),
+            "median": float(np.median(total_times)),
+            "std_dev": float(total_times.std(ddof=1)) if len(total_times) > 1 else 0,
+            "min": float(total_times.min()),
+            "max": float(total_times.max())
         },
         "components": {
-            "chatgpt": statistics.mean(chatgpt_times),
-            "shodan": statistics.mean(shodan_times),
-            "solution": statistics.mean(solution_times)
+            "chatgpt": float(columns['ChatGPT Time'].mean()),
+            "shodan": float(columns['Shodan Time'].mean()),
+            "solution": float(columns['Solution Time'].mean())
         }
     }
 
-def save_results(results: List[TimingResult], analysis: Dict, output_dir: str = "evaluation_results"):
+async def save_results(results: TimingResults, analysis: Dict, output_dir: str = "evaluation_results"):
     """
     Save evaluation results and analysis to files.
     
     Args:
-        results (List[TimingResult]): Raw timing results
+        results (TimingResults): Raw timing results
         analysis (Dict): Statistical analysis
         output_dir (str): Directory to save results
     """
@@ -131,20 +197,62 @@ def save_results(results: List[TimingResult], analysis: Dict, output_dir: str =
     
     # Save raw results to CSV
     csv_path = f"{output_dir}/timing_results_{timestamp}.csv"
-    with open(csv_path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Total Time', 'ChatGPT Time', 'Shodan Time', 'Solution Time'])
-        for r in results:
-            writer.writerow([r.total, r.chatgpt, r.shodan, r.solution])
+    async with aiofiles.open(csv_path, 'w', newline='') as f:
+        await f.write(pd.DataFrame(results.columns()).to_csv(index=False))
     
     # Save analysis to JSON
     json_path = f"{output_dir}/analysis_{timestamp}.json"
-    with open(json_path, 'w') as f:
-        json.dump(analysis, f, indent=4)
+    async with aiofiles.open(json_path, 'wb') as f:
+        await f.write(orjson.dumps(analysis, option=orjson.OPT_INDENT_2))
+
+async def run_batch_evaluation(test_queries: List[str], limit: int = 5, output_dir: str = "evaluation_results") -> None:
+    """
+    Generate solutions for every query's Shodan results in one OpenAI Batch API job.
+
+    Batch jobs may take up to 24 hours, so no latencies are recorded; the
+    generated solutions are saved for offline review instead.
+
+    Args:
+        test_queries (List[str]): List of queries to run
+        limit (int): Number of Shodan results per query
+        output_dir (str): Directory to save results
+    """
+    # Generate and run each query's Shodan search; the limiter paces Shodan
+    async def search(query: str) -> Tuple[Dict, List[Dict]]:
+        chatgpt_response = await get_shodan_query(query)
+        async with SHODAN_LIMITER:
+            return chatgpt_response, await execute_shodan_query(chatgpt_response['shodan_query'], limit)
+
+    searches = await asyncio.gather(*(search(query) for query in test_queries))
+
+    # Submit every result in a single batch; solutions come back in input order
+    all_results = [result for _, shodan_results in searches for result in shodan_results]
+    print(f"Submitting {len(all_results)} results as one batch job...")
+    solutions = iter(await get_security_solutions(all_results, use_batch=True))
+
+    report = [
+        {
+            "query": query,
+            "shodan_query": chatgpt_response['shodan_query'],
+            "results": [{**result, "solution": next(solutions)} for result in shodan_results]
+        }
+        for query, (chatgpt_response, shodan_results) in zip(test_queries, searches)
+    ]
 
-async def main():
+    # Save alongside the timing results, under a name the visualizer ignores
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    json_path = f"{output_dir}/batch_solutions_{timestamp}.json"
+    async with aiofiles.open(json_path, 'wb') as f:
+        await f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    print(f"Batch solutions saved to: {json_path}")
+
+async def main(batch: bool = False):
     """
     Main function to run the evaluation.
+
+    Args:
+        batch (bool): Generate solutions through the Batch API instead of measuring latency
     """
     # Sample test queries
     test_queries = [
@@ -155,6 +263,11 @@ async def main():
         "Find exposed Jenkins servers"
     ]
     
+    if batch:
+        print("Starting VulnGPT Batch Solution Generation...")
+        await run_batch_evaluation(test_queries)
+        return
+
     print("Starting VulnGPT Performance Evaluation...")
     print(f"Testing {len(test_queries)} queries with 10 iterations each...")
     
@@ -165,7 +278,7 @@ async def main():
     analysis = analyze_results(results)
     
     # Save results
-    save_results(results, analysis)
+    await save_results(results, analysis)
     
     # Print summary
     print("\nEvaluation Results:")
@@ -178,4 +291,18 @@ async def main():
     print(f"Solution Generation: {analysis['components']['solution']:.2f} seconds")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="VulnGPT performance evaluation")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="generate solutions through the OpenAI Batch API (cheaper, up to 24h) instead of measuring latency"
+    )
+    args = parser.parse_args()
+
+    try:
+        # libuv-based event loop; faster for this network-bound workload
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    asyncio.run(main(batch=args.batch)) 
\ No newline at end of file
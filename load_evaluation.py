@@ -11,11 +11,12 @@ Date: 2024-11-17
 import asyncio
 import time
 from typing import List, Dict, Tuple
-import statistics
 from services.chatgpt import get_shodan_query
 from services.shodan import execute_shodan_query
 from services.vulnSolution import get_security_solutions
-import json
+import orjson
+import aiofiles
+import io
 from datetime import datetime
 import csv
 from pathlib import Path
@@ -30,16 +31,28 @@ class ConcurrentQueryResult:
     success: bool
     error: str = None
 
+@dataclass
+class LoadTestSummary:
+    """
+    Struct-of-arrays view of a load test, one row per simulated user.
+    """
+    times: np.ndarray
+    success: np.ndarray
+
 class LoadTester:
-    def __init__(self, output_dir: str = "load_test_results"):
+    def __init__(self, output_dir: str = "load_test_results", max_in_flight: int = 50):
         """
         Initialize the load tester.
         
         Args:
             output_dir (str): Directory to store test results
+            max_in_flight (int): Maximum number of queries sent to the upstream APIs at once
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Bound outbound concurrency to avoid a thundering herd on OpenAI and Shodan
+        self.semaphore = asyncio.Semaphore(max_in_flight)
 
     async def execute_single_query(self, query: str) -> ConcurrentQueryResult:
         """
@@ -51,105 +64,120 @@ class LoadTester:
         Returns:
             ConcurrentQueryResult: Results and timing data
         """
-        start_time = time.time()
-        try:
-            # Execute the complete query pipeline
-            chatgpt_response = await get_shodan_query(query)
-            shodan_results = await execute_shodan_query(chatgpt_response['shodan_query'], limit=5)
-            await get_security_solutions(shodan_results)
-            
-            total_time = time.time() - start_time
-            return ConcurrentQueryResult(
-                query=query,
-                total_time=total_time,
-                success=True
-            )
-        except Exception as e:
-            total_time = time.time() - start_time
-            return ConcurrentQueryResult(
-                query=query,
-                total_time=total_time,
-                success=False,
-                error=str(e)
-            )
-
-    async def run_concurrent_queries(self, queries: List[str], concurrent_users: int = 10) -> List[ConcurrentQueryResult]:
+        async with self.semaphore:
+            start_time = time.perf_counter_ns()
+            try:
+                # Execute the complete query pipeline, bypassing the caches used by /query
+                chatgpt_response = await get_shodan_query(query, use_cache=False)
+                shodan_results = await execute_shodan_query.__wrapped__(chatgpt_response['shodan_query'], limit=5)
+                await get_security_solutions(shodan_results)
+                
+                total_time = (time.perf_counter_ns() - start_time) * 1e-9
+                return ConcurrentQueryResult(
+                    query=query,
+                    total_time=total_time,
+                    success=True
+                )
+            except Exception as e:
+                total_time = (time.perf_counter_ns() - start_time) * 1e-9
+                return ConcurrentQueryResult(
+                    query=query,
+                    total_time=total_time,
+                    success=False,
+                    error=str(e)
+                )
+
+    async def run_concurrent_queries(self, queries: List[str], concurrent_users: int = 10) -> LoadTestSummary:
         """
         Run multiple queries concurrently to simulate multiple users.
+
+        Each result is written to the CSV as soon as it completes, and only
+        its response time and status are kept, in preallocated arrays.
         
         Args:
             queries (List[str]): List of queries to execute
             concurrent_users (int): Number of concurrent users to simulate
             
         Returns:
-            List[ConcurrentQueryResult]: Results for all queries
+            LoadTestSummary: Response times and statuses for all queries
         """
-        # Create tasks for concurrent execution
-        tasks = []
-        for _ in range(concurrent_users):
-            # Cycle through queries if we have fewer queries than concurrent users
-            for query in queries:
-                tasks.append(self.execute_single_query(query))
-                if len(tasks) >= concurrent_users:
-                    break
-            if len(tasks) >= concurrent_users:
-                break
-
-        # Execute all tasks concurrently
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        return [r for r in results if isinstance(r, ConcurrentQueryResult)]
-
-    def analyze_results(self, results: List[ConcurrentQueryResult]) -> Dict:
+        # Create one task per simulated user, cycling through the queries
+        tasks = [
+            self.execute_single_query(queries[i % len(queries)])
+            for i in range(concurrent_users)
+        ]
+
+        summary = LoadTestSummary(
+            times=np.empty(concurrent_users, dtype=np.float64),
+            success=np.empty(concurrent_users, dtype=bool)
+        )
+        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        # Stream raw results to CSV in completion order
+        csv_path = self.output_dir / f"load_test_results_{self.timestamp}.csv"
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Query', 'Total Time', 'Success', 'Error'])
+        async with aiofiles.open(csv_path, 'w', newline='') as f:
+            for row, next_result in enumerate(asyncio.as_completed(tasks)):
+                result = await next_result
+                writer.writerow([result.query, result.total_time, result.success, result.error])
+                # Flush the formatted row(s) without blocking the event loop
+                await f.write(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+                summary.times[row] = result.total_time
+                summary.success[row] = result.success
+
+        return summary
+
+    def analyze_results(self, summary: LoadTestSummary) -> Dict:
         """
         Analyze the load test results.
         
         Args:
-            results (List[ConcurrentQueryResult]): Results from concurrent queries
+            summary (LoadTestSummary): Response times and statuses from concurrent queries
             
         Returns:
             Dict: Analysis of the results
         """
-        successful_times = [r.total_time for r in results if r.success]
-        failed_times = [r.total_time for r in results if not r.success]
+        # Mask once; every statistic below reads the same successful-time array
+        successful_times = summary.times[summary.success]
+        total_queries = len(summary.times)
+        successful_queries = len(successful_times)
+        
+        if successful_queries:
+            median, percentile_95 = np.quantile(successful_times, [0.5, 0.95])
+        else:
+            median = percentile_95 = 0
         
         analysis = {
-            "total_queries": len(results),
-            "successful_queries": len(successful_times),
-            "failed_queries": len(failed_times),
-            "success_rate": len(successful_times) / len(results) * 100 if results else 0,
+            "total_queries": total_queries,
+            "successful_queries": successful_queries,
+            "failed_queries": total_queries - successful_queries,
+            "success_rate": successful_queries / total_queries * 100 if total_queries else 0,
             "response_times": {
-                "mean": statistics.mean(successful_times) if successful_times else 0,
-                "median": statistics.median(successful_times) if successful_times else 0,
-                "std_dev": statistics.stdev(successful_times) if len(successful_times) > 1 else 0,
-                "min": min(successful_times) if successful_times else 0,
-                "max": max(successful_times) if successful_times else 0,
-                "95th_percentile": np.percentile(successful_times, 95) if successful_times else 0
+                "mean": float(successful_times.mean()) if successful_queries else 0,
+                "median": float(median),
+                "std_dev": float(successful_times.std(ddof=1)) if successful_queries > 1 else 0,
+                "min": float(successful_times.min()) if successful_queries else 0,
+                "max": float(successful_times.max()) if successful_queries else 0,
+                "95th_percentile": float(percentile_95)
             }
         }
         return analysis
 
-    def save_results(self, results: List[ConcurrentQueryResult], analysis: Dict):
+    async def save_results(self, analysis: Dict):
         """
-        Save the load test results and analysis.
+        Save the load test analysis next to the streamed raw results.
         
         Args:
-            results (List[ConcurrentQueryResult]): Raw test results
             analysis (Dict): Analyzed results
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # Save raw results to CSV
-        csv_path = self.output_dir / f"load_test_results_{timestamp}.csv"
-        with open(csv_path, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Query', 'Total Time', 'Success', 'Error'])
-            for result in results:
-                writer.writerow([result.query, result.total_time, result.success, result.error])
-
         # Save analysis to JSON
-        json_path = self.output_dir / f"load_test_analysis_{timestamp}.json"
-        with open(json_path, 'w') as f:
-            json.dump(analysis, f, indent=4)
+        json_path = self.output_dir / f"load_test_analysis_{self.timestamp}.json"
+        async with aiofiles.open(json_path, 'wb') as f:
+            await f.write(orjson.dumps(analysis, option=orjson.OPT_INDENT_2))
 
     def print_analysis(self, analysis: Dict):
         """
@@ -187,17 +215,23 @@ async def main():
     print("Starting VulnGPT Load Test...")
     print(f"Simulating 10 concurrent users...")
     
-    # Run load test
-    results = await load_tester.run_concurrent_queries(test_queries, concurrent_users=10)
+    # Run load test, streaming raw results to disk
+    summary = await load_tester.run_concurrent_queries(test_queries, concurrent_users=10)
     
     # Analyze results
-    analysis = load_tester.analyze_results(results)
+    analysis = load_tester.analyze_results(summary)
     
-    # Save results
-    load_tester.save_results(results, analysis)
+    # Save analysis
+    await load_tester.save_results(analysis)
     
     # Print analysis
     load_tester.print_analysis(analysis)
 
 if __name__ == "__main__":
+    try:
+        # libuv-based event loop; faster for this network-bound workload
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main()) 
\ No newline at end of file
@@ -8,6 +8,8 @@ Author: Shovon Paul
 Date: 2024-11-17
 """
 
+import matplotlib
+matplotlib.use('Agg')  # Render straight to files; skip GUI backend initialization
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
@@ -17,16 +19,27 @@ from typing import Dict, List
 import numpy as np
 from datetime import datetime
 
+# Font sizes shared by all load test plots
+PLOT_RC_PARAMS = {
+    'font.size': 24,
+    'axes.labelsize': 28,
+    'xtick.labelsize': 24,
+    'ytick.labelsize': 24
+}
+
+# Apply the plot theme once per process instead of on every instantiation.
+# The font sizes go last because set_theme resets rcParams.
+plt.style.use('default')
+sns.set_theme(style="whitegrid")
+sns.set_palette("husl")
+plt.rcParams.update(PLOT_RC_PARAMS)
+
 class LoadTestVisualizer:
     def __init__(self, results_dir: str = "load_test_results"):
         """
         Initialize the visualizer with the results directory.
         """
         self.results_dir = Path(results_dir)
-        # Set style for plots
-        plt.style.use('default')
-        sns.set_theme(style="whitegrid")
-        sns.set_palette("husl")
 
     def load_latest_results(self) -> tuple[pd.DataFrame, Dict]:
         """
@@ -43,132 +56,87 @@ class LoadTestVisualizer:
         
         print(f"Loading data from:\n{latest_csv}\n{latest_json}")
         
-        df = pd.read_csv(latest_csv)
+        # Only the timing and status columns are plotted; skip dtype inference
+        df = pd.read_csv(
+            latest_csv,
+            usecols=['Total Time', 'Success'],
+            dtype={'Total Time': np.float64, 'Success': 'boolean'},
+            engine='c'
+        )
         with open(latest_json, 'r') as f:
             analysis = json.load(f)
             
         return df, analysis
 
-    def create_response_time_distribution(self, df: pd.DataFrame) -> None:
+    def create_response_time_distribution(self, ax: plt.Axes, df: pd.DataFrame) -> None:
         """
-        Create a distribution plot of response times under load.
+        Draw a distribution plot of response times under load.
         """
-        plt.clf()
-        plt.figure(figsize=(15, 8))
+        # Create distribution plot
+        sns.histplot(data=df, x='Total Time', bins=20, kde=True, ax=ax)
         
-        try:
-            plt.rcParams.update({
-                'font.size': 24,
-                'axes.labelsize': 28,
-                'xtick.labelsize': 24,
-                'ytick.labelsize': 24
-            })
-            
-            # Create distribution plot
-            sns.histplot(data=df, x='Total Time', bins=20, kde=True)
-            
-            plt.xlabel('Response Time (seconds)', labelpad=15, fontsize=28, fontweight='bold')
-            plt.ylabel('Frequency', labelpad=15, fontsize=28, fontweight='bold')
-            
-            plt.tight_layout()
-            
-            output_path = self.results_dir / f'load_distribution_{datetime.now():%Y%m%d_%H%M%S}.png'
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            print(f"Saved response time distribution plot to: {output_path}")
-            plt.close()
-        except Exception as e:
-            print(f"Error creating response time distribution plot: {str(e)}")
-            plt.close()
+        ax.set_xlabel('Response Time (seconds)', labelpad=15, fontsize=28, fontweight='bold')
+        ax.set_ylabel('Frequency', labelpad=15, fontsize=28, fontweight='bold')
 
-    def create_success_rate_plot(self, analysis: Dict) -> None:
+    def create_success_rate_plot(self, ax: plt.Axes, analysis: Dict) -> None:
         """
-        Create a pie chart showing success vs failure rate.
+        Draw a pie chart showing success vs failure rate.
         """
-        plt.clf()
-        plt.figure(figsize=(12, 8))
+        # Prepare data
+        sizes = [analysis['successful_queries'], analysis['failed_queries']]
+        labels = [f'Successful\n({sizes[0]} queries)', f'Failed\n({sizes[1]} queries)']
+        colors = ['#66b3ff', '#ff9999']
         
-        try:
-            plt.rcParams.update({
-                'font.size': 24,
-                'axes.labelsize': 28
-            })
-            
-            # Prepare data
-            sizes = [analysis['successful_queries'], analysis['failed_queries']]
-            labels = [f'Successful\n({sizes[0]} queries)', f'Failed\n({sizes[1]} queries)']
-            colors = ['#66b3ff', '#ff9999']
-            
-            # Create pie chart without title
-            plt.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%',
-                   textprops={'fontsize': 24, 'fontweight': 'bold'})
-            
-            plt.tight_layout()
-            
-            output_path = self.results_dir / f'success_rate_{datetime.now():%Y%m%d_%H%M%S}.png'
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            print(f"Saved success rate plot to: {output_path}")
-            plt.close()
-        except Exception as e:
-            print(f"Error creating success rate plot: {str(e)}")
-            plt.close()
+        # Create pie chart without title
+        ax.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%',
+               textprops={'fontsize': 24, 'fontweight': 'bold'})
 
-    def create_performance_metrics(self, analysis: Dict) -> None:
+    def create_performance_metrics(self, ax: plt.Axes, analysis: Dict) -> None:
         """
-        Create a bar plot of key performance metrics.
+        Draw a bar plot of key performance metrics.
         """
-        plt.clf()
-        plt.figure(figsize=(15, 8))
+        # Prepare data
+        metrics = {
+            'Mean': analysis['response_times']['mean'],
+            'Median': analysis['response_times']['median'],
+            '95th\nPercentile': analysis['response_times']['95th_percentile'],
+            'Max': analysis['response_times']['max']
+        }
         
-        try:
-            plt.rcParams.update({
-                'font.size': 24,
-                'axes.labelsize': 28,
-                'xtick.labelsize': 24,
-                'ytick.labelsize': 24
-            })
-            
-            # Prepare data
-            metrics = {
-                'Mean': analysis['response_times']['mean'],
-                'Median': analysis['response_times']['median'],
-                '95th\nPercentile': analysis['response_times']['95th_percentile'],
-                'Max': analysis['response_times']['max']
-            }
-            
-            # Create bar plot without title
-            bars = plt.bar(metrics.keys(), metrics.values(), color='skyblue')
-            plt.ylabel('Response Time (seconds)', labelpad=15, fontsize=28, fontweight='bold')
-            
-            # Add value labels
-            for bar in bars:
-                height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{height:.2f}s',
-                        ha='center', va='bottom',
-                        fontsize=24, fontweight='bold')
-            
-            plt.tight_layout()
-            
-            output_path = self.results_dir / f'load_metrics_{datetime.now():%Y%m%d_%H%M%S}.png'
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            print(f"Saved performance metrics plot to: {output_path}")
-            plt.close()
-        except Exception as e:
-            print(f"Error creating performance metrics plot: {str(e)}")
-            plt.close()
+        # Create bar plot without title
+        bars = ax.bar(metrics.keys(), metrics.values(), color='skyblue')
+        ax.set_ylabel('Response Time (seconds)', labelpad=15, fontsize=28, fontweight='bold')
+        
+        # Add value labels
+        for bar in bars:
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height,
+                    f'{height:.2f}s',
+                    ha='center', va='bottom',
+                    fontsize=24, fontweight='bold')
 
     def create_all_visualizations(self) -> None:
         """
-        Generate all load test visualization plots.
+        Generate all load test plots as panels of a single figure.
         """
         try:
             print("Loading load test results...")
             df, analysis = self.load_latest_results()
             
             print("Generating visualizations...")
-            self.create_response_time_distribution(df)
-            self.create_success_rate_plot(analysis)
-            self.create_performance_metrics(analysis)
+            fig, (dist_ax, rate_ax, metrics_ax) = plt.subplots(1, 3, figsize=(42, 8))
+            try:
+                self.create_response_time_distribution(dist_ax, df)
+                self.create_success_rate_plot(rate_ax, analysis)
+                self.create_performance_metrics(metrics_ax, analysis)
+                
+                fig.tight_layout()
+                
+                output_path = self.results_dir / f'load_test_summary_{datetime.now():%Y%m%d_%H%M%S}.png'
+                fig.savefig(output_path, dpi=300, bbox_inches='tight')
+                print(f"Saved load test summary plot to: {output_path}")
+            finally:
+                plt.close(fig)
             
             print(f"Visualizations saved in: {self.results_dir}")
             
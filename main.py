@@ -8,47 +8,205 @@ Author: Shovon Paul
 Date: 2024-11-17
 """
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from services.chatgpt import get_shodan_query
-from services.shodan import execute_shodan_query
+import orjson
+import msgspec
+import asyncio
+from services.chatgpt import get_shodan_query, QUERY_GENERATION_FALLBACK
+from services.shodan import execute_shodan_query, api as shodan_api
 from services.vulnSolution import get_security_solutions
-import json
-from typing import Optional
+from services.semanticCache import SemanticCache
+from services.openaiClient import client as openai_client, OPENAI_MODEL
+from typing import Annotated, Any, Optional
 import os
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response serialized with orjson instead of the standard library.
+    """
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+# Largest accepted request body in bytes, and longest accepted question in characters
+MAX_REQUEST_BODY_SIZE = 8192
+MAX_QUERY_LENGTH = 2000
+
+class RequestBodyTooLarge(Exception):
+    """
+    Raised while reading a request body that exceeds the size limit.
+    """
+
+class MaxBodySizeMiddleware:
+    """
+    ASGI middleware that rejects request bodies larger than max_body_size
+    with 413, before any route reads or parses them.
+    """
+    def __init__(self, app, max_body_size: int = MAX_REQUEST_BODY_SIZE):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    @staticmethod
+    async def reject(scope, receive, send):
+        """
+        Send the 413 response; only built when a request is actually rejected.
+        """
+        response = ORJSONResponse(status_code=413, content={"detail": "Request body too large"})
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Reject up front when the client declares an oversized body
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_body_size:
+                await self.reject(scope, receive, send)
+                return
+
+        # Otherwise count bytes as they arrive (e.g. chunked uploads)
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise RequestBodyTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except RequestBodyTooLarge:
+            if response_started:
+                raise
+            await self.reject(scope, receive, send)
+
 # Initialize FastAPI application
 app = FastAPI(
     title="VulnGPT",
     description="Vulnerability Guided Protection Toolkit",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
+app.add_middleware(MaxBodySizeMiddleware, max_body_size=MAX_REQUEST_BODY_SIZE)
+
+# Plain-text layout of the /query guidance, compiled once at import.
+# Autoescaping is disabled because the output is text, not HTML.
+RESPONSE_TEMPLATE = templates.env.from_string("""\
+{% autoescape false -%}
+🔍 Suggested Shodan Query:
+{{ shodan_query }}
+
+📝 Explanation:
+{{ explanation }}
 
-class QueryRequest(BaseModel):
+🌐 Results and Solutions:
+{% for result, solution in results %}
+📊 Result {{ loop.index }}:
+IP: {{ result.ip }}
+Port: {{ result.port }}
+Organization: {{ result.organization }}
+Location: {{ result.location }}
+Product: {{ result.product }}
+Version: {{ result.version if result.version != 'N/A' else 'Version not detected' }}
+Operating System: {{ result.os if result.os != 'N/A' else 'OS not detected' }}
+{% if result.vulns -%}
+🔴 Vulnerabilities:
+{% for vuln in result.vulns -%}
+- {{ vuln }}
+{% endfor -%}
+{% else -%}
+🟢 No known vulnerabilities detected
+{% endif %}
+🛡️ Proposed Solution for Result {{ loop.index }}:
+{{ solution }}
+{% endfor %}
+{%- endautoescape %}
+""")
+
+# Cache of generated Shodan queries, keyed on question similarity
+semantic_cache = SemanticCache()
+
+class QueryRequest(msgspec.Struct):
     """
-    Pydantic model for query requests.
+    msgspec model for query requests, decoded and validated in a single pass.
     """
-    query: str
+    query: Annotated[str, msgspec.Meta(max_length=MAX_QUERY_LENGTH)]
     limit: int = 5  # Default limit of 5 results
 
-    class Config:
-        schema_extra = {
-            "example": {
-                "query": "Find vulnerable Apache servers in Germany",
-                "limit": 5
+# Reusable decoder for /query bodies
+query_request_decoder = msgspec.json.Decoder(QueryRequest)
+
+# Document the request body in OpenAPI, since FastAPI no longer parses it
+_, _query_request_schemas = msgspec.json.schema_components([QueryRequest])
+QUERY_REQUEST_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": _query_request_schemas["QueryRequest"],
+                "example": {
+                    "query": "Find vulnerable Apache servers in Germany",
+                    "limit": 5
+                }
             }
         }
+    }
+}
+
+# Longest time startup waits for the client warm-up, in seconds
+WARM_UP_TIMEOUT = 5
+
+@app.on_event("startup")
+async def warm_up_clients():
+    """
+    Open connections to OpenAI and Shodan before the first request arrives,
+    so it does not pay the TLS handshake cost. Failures are logged only, and
+    startup stops waiting after WARM_UP_TIMEOUT seconds.
+    """
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(
+                openai_client.models.retrieve(OPENAI_MODEL),
+                asyncio.to_thread(shodan_api.info),
+                return_exceptions=True
+            ),
+            timeout=WARM_UP_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        print(f"Client warm-up did not finish within {WARM_UP_TIMEOUT} seconds; continuing startup")
+        return
+
+    for service, result in zip(("OpenAI", "Shodan"), results):
+        if isinstance(result, Exception):
+            print(f"Error warming up {service} client: {str(result)}")
+
+@app.on_event("shutdown")
+async def close_openai_client():
+    """
+    Close the shared OpenAI client's connection pool on shutdown.
+    """
+    await openai_client.close()
 
 @app.get("/")
 async def root(request: Request):
@@ -63,17 +221,32 @@ async def root(request: Request):
     """
     return templates.TemplateResponse("index.html", {"request": request})
 
-@app.post("/query")
-async def process_query(request: QueryRequest):
+@app.post(
+    "/query",
+    response_class=ORJSONResponse,
+    response_model=None,
+    openapi_extra=QUERY_REQUEST_OPENAPI
+)
+async def process_query(http_request: Request):
     """
     Process user queries and return ChatGPT guidance, Shodan results, and security solutions.
     """
     try:
-        if not request.query.strip():
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        request = query_request_decoder.decode(await http_request.body())
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid request body: {str(e)}")
+
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
 
-        # Get ChatGPT response
-        chatgpt_response = await get_shodan_query(request.query)
+    try:
+        # Get ChatGPT response, reusing it for semantically similar questions
+        chatgpt_response = await semantic_cache.lookup(request.query)
+        if chatgpt_response is None:
+            chatgpt_response = await get_shodan_query(request.query)
+            # Only cache real queries, so a failed generation is retried next time
+            if chatgpt_response is not QUERY_GENERATION_FALLBACK:
+                await semantic_cache.store(request.query, chatgpt_response)
         
         # Execute Shodan query with user-specified limit
         shodan_results = await execute_shodan_query(chatgpt_response['shodan_query'], request.limit)
@@ -81,43 +254,18 @@ async def process_query(request: QueryRequest):
         # Get security solutions for each result
         security_solutions = await get_security_solutions(shodan_results)
         
-        # Format the complete response
-        formatted_response = (
-            f"🔍 Suggested Shodan Query:\n"
-            f"{chatgpt_response['shodan_query']}\n\n"
-            f"📝 Explanation:\n"
-            f"{chatgpt_response['explanation']}\n\n"
-            f"🌐 Results and Solutions:\n"
+        # Render the results with their corresponding solutions
+        formatted_response = RESPONSE_TEMPLATE.render(
+            shodan_query=chatgpt_response['shodan_query'],
+            explanation=chatgpt_response['explanation'],
+            results=zip(shodan_results, security_solutions)
         )
-
-        # Add Shodan results with their corresponding solutions
-        for idx, (result, solution) in enumerate(zip(shodan_results, security_solutions), 1):
-            # Add result
-            formatted_response += (
-                f"\n📊 Result {idx}:\n"
-                f"IP: {result['ip']}\n"
-                f"Port: {result['port']}\n"
-                f"Organization: {result['organization']}\n"
-                f"Location: {result['location']}\n"
-                f"Product: {result['product']}\n"
-                f"Version: {result['version'] if result['version'] != 'N/A' else 'Version not detected'}\n"
-                f"Operating System: {result['os'] if result['os'] != 'N/A' else 'OS not detected'}\n"
-            )
-            
-            # Add vulnerabilities if present
-            if result['vulns']:
-                formatted_response += f"🔴 Vulnerabilities:\n"
-                for vuln in result['vulns']:
-                    formatted_response += f"- {vuln}\n"
-            else:
-                formatted_response += "🟢 No known vulnerabilities detected\n"
-            
-            # Add solution for this result
-            formatted_response += f"\n🛡️ Proposed Solution for Result {idx}:\n{solution}\n"
         
-        return JSONResponse({
-            "guidance": formatted_response
-        })
+        # Serialize directly so FastAPI skips its response encoding step
+        return Response(
+            content=orjson.dumps({"guidance": formatted_response}),
+            media_type="application/json"
+        )
 
     except Exception as e:
         print(f"Error processing query: {str(e)}")
@@ -125,5 +273,3 @@ async def process_query(request: QueryRequest):
             status_code=500,
             detail=f"Error processing query: {str(e)}"
         )
-
-# Your existing routes go here... 
\ No newline at end of file
@@ -9,22 +9,11 @@ Author: Shovon Paul
 Date: 2024-11-17
 """
 
-from openai import AsyncOpenAI
-from typing import Dict, Any
+from async_lru import alru_cache
+from typing import Dict, Any, List, TypedDict
 from fastapi import HTTPException
-import os
-from dotenv import load_dotenv
-import json
-
-# Load environment variables
-load_dotenv()
-
-# Initialize AsyncOpenAI client with API key
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
-
-client = AsyncOpenAI(api_key=api_key)
+import msgspec
+from services.openaiClient import client, OPENAI_MODEL
 
 # Define system prompt for consistent GPT responses
 SYSTEM_PROMPT = """You are a Shodan search expert. Your role is to:
@@ -39,12 +28,128 @@ Example response format:
     "explanation": "This query searches for Nginx web servers located in the United States..."
 }"""
 
-async def get_shodan_query(user_question: str) -> Dict[str, Any]:
+class ShodanQueryReply(TypedDict):
+    """
+    Expected shape of the model's reply; other fields are dropped.
+    """
+    shodan_query: str
+    explanation: str
+
+# Decodes and validates replies in one pass, so malformed replies raise
+# before either cache can store them
+shodan_query_reply_decoder = msgspec.json.Decoder(ShodanQueryReply)
+
+# Returned when the model's reply is malformed; callers must not cache or modify it
+QUERY_GENERATION_FALLBACK = {
+    "shodan_query": "Error: Could not generate query",
+    "explanation": "The response format was invalid. Please try rephrasing your question."
+}
+
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+class _CachedQuestion:
+    """
+    Cache key for a question: compares equal to questions that differ only in
+    case or surrounding whitespace, while keeping the original text for the model.
+    """
+    __slots__ = ("text", "key")
+
+    def __init__(self, text: str):
+        self.text = text.strip()
+        self.key = self.text.lower()
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _CachedQuestion) and self.key == other.key
+
+async def _generate_shodan_query(question: str) -> Dict[str, Any]:
+    """
+    Request a Shodan query and explanation from OpenAI.
+
+    Args:
+        question (str): The natural language question
+
+    Returns:
+        Dict[str, Any]: A dictionary containing the Shodan query and its explanation
+
+    Raises:
+        msgspec.DecodeError: If the model's reply is not valid JSON or lacks
+            string 'shodan_query' and 'explanation' fields
+    """
+    # Stream the completion so the reply can be parsed as soon as it is complete
+    stream = await client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=[SYSTEM_MESSAGE, {"role": "user", "content": question}],
+        temperature=0.7,
+        max_tokens=500,
+        stream=True
+    )
+    
+    # Track brace depth (ignoring braces inside strings) to find where the
+    # first JSON object in the reply ends, then stop reading the stream
+    received: List[str] = []
+    offset = 0
+    start = None
+    depth = 0
+    in_string = escaped = False
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content or ""
+            for i, char in enumerate(text):
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif char == "\\":
+                        escaped = True
+                    elif char == '"':
+                        in_string = False
+                elif char == "{":
+                    if depth == 0:
+                        start = offset + i
+                    depth += 1
+                elif depth and char == '"':
+                    in_string = True
+                elif depth and char == "}":
+                    depth -= 1
+                    if depth == 0:
+                        reply = "".join(received) + text[:i + 1]
+                        return shodan_query_reply_decoder.decode(reply[start:])
+            received.append(text)
+            offset += len(text)
+    finally:
+        await stream.close()
+    
+    # The reply never contained a complete object; parse it as-is
+    return shodan_query_reply_decoder.decode("".join(received))
+
+@alru_cache(maxsize=1024, ttl=3600)
+async def _cached_shodan_query(question: _CachedQuestion) -> Dict[str, Any]:
+    """
+    Cached wrapper around _generate_shodan_query.
+
+    Results are cached for an hour, so callers share the returned dictionary.
+    Malformed replies raise and are therefore never cached.
+
+    Args:
+        question (_CachedQuestion): The question and its normalized cache key
+
+    Returns:
+        Dict[str, Any]: A dictionary containing the Shodan query and its explanation
+    """
+    return await _generate_shodan_query(question.text)
+
+async def get_shodan_query(user_question: str, use_cache: bool = True) -> Dict[str, Any]:
     """
     Generate a Shodan query based on the user's natural language question.
 
     Args:
         user_question (str): The user's natural language question about what to search for
+        use_cache (bool): Reuse replies for repeated questions; disable to always call OpenAI,
+            e.g. when measuring its latency
 
     Returns:
         Dict[str, Any]: A dictionary containing the Shodan query and its explanation
@@ -57,30 +162,13 @@ async def get_shodan_query(user_question: str) -> Dict[str, Any]:
         if not user_question.strip():
             raise ValueError("Empty question provided")
 
-        # Create chat completion request using new API syntax
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo-0125",  # Using the latest stable model version
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_question}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        
-        # Extract and validate response content
-        content = response.choices[0].message.content
-        
-        # Handle non-JSON responses gracefully
         try:
-            if isinstance(content, str):
-                content = json.loads(content)
-            return content
-        except json.JSONDecodeError:
-            return {
-                "shodan_query": "Error: Could not generate query",
-                "explanation": "The response format was invalid. Please try rephrasing your question."
-            }
+            if use_cache:
+                return await _cached_shodan_query(_CachedQuestion(user_question))
+            return await _generate_shodan_query(user_question.strip())
+        except msgspec.DecodeError:
+            # Handle non-JSON or malformed responses gracefully
+            return QUERY_GENERATION_FALLBACK
 
     except Exception as e:
         # Log the error (in a production environment, use proper logging)
@@ -0,0 +1,39 @@
+"""
+OpenAI Client Module
+
+This module provides the AsyncOpenAI client shared by the ChatGPT and
+VulnSolution services, so both reuse one connection pool.
+
+Author: Shovon Paul
+Date: 2026-10-15
+"""
+
+import httpx
+from openai import AsyncOpenAI
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Initialize AsyncOpenAI client with API key
+api_key = os.getenv("OPENAI_API_KEY")
+if not api_key:
+    raise ValueError("OPENAI_API_KEY not found in environment variables")
+
+# Chat model used by all OpenAI services, resolved once at import time
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo-0125")
+
+# HTTP/2 multiplexes concurrent completions over few connections;
+# the pool is sized for gather-style bursts of requests. Long non-streaming
+# completions keep the SDK's 600 second default, while unreachable hosts
+# fail fast on connect. The client serializes request messages without
+# mutating them, so services share prebuilt system-message dicts across calls.
+client = AsyncOpenAI(
+    api_key=api_key,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        http2=True,
+        timeout=httpx.Timeout(600.0, connect=5.0)
+    )
+)
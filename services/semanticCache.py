@@ -0,0 +1,149 @@
+"""
+Semantic Cache Module
+
+This module provides an in-process semantic cache for ChatGPT query generation.
+User questions are embedded with a sentence-BERT model and compared against
+previously answered questions, so near-duplicate prompts can reuse an existing
+Shodan query instead of waiting on a new OpenAI completion.
+
+Author: Shovon Paul
+Date: 2026-10-15
+"""
+
+import asyncio
+import faiss
+from collections import OrderedDict
+from functools import lru_cache
+import itertools
+import numpy as np
+from sentence_transformers import SentenceTransformer
+import time
+from typing import Dict, Any, Optional, Tuple
+
+# Sentence-BERT model used to embed user questions (384-dimensional output)
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Minimum cosine similarity for two questions to be considered equivalent
+SIMILARITY_THRESHOLD = 0.92
+
+# Number of distinct question embeddings memoized per cache
+EMBEDDING_CACHE_SIZE = 2048
+
+# Maximum number of cached responses, and how long each stays valid (seconds);
+# the TTL matches the exact-match query cache in the ChatGPT service
+MAX_ENTRIES = 10000
+ENTRY_TTL = 3600
+
+class SemanticCache:
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        threshold: float = SIMILARITY_THRESHOLD,
+        max_entries: int = MAX_ENTRIES,
+        ttl: float = ENTRY_TTL
+    ):
+        """
+        Initialize the embedding model and an empty similarity index.
+
+        Args:
+            model_name (str): Name of the sentence-transformers model to load
+            threshold (float): Minimum cosine similarity required for a cache hit
+            max_entries (int): Maximum number of responses kept before the oldest are evicted
+            ttl (float): Seconds a cached response stays valid
+        """
+        self.model = SentenceTransformer(model_name)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Embeddings are L2-normalized, so inner product equals cosine similarity.
+        # The ID map lets the oldest entries be removed without renumbering the rest.
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.model.get_sentence_embedding_dimension()))
+        # Cached responses and their storage times by index id, oldest first
+        self.entries: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._ids = itertools.count()
+        # FAISS is not safe for concurrent search and add, so index access is serialized
+        self._lock = asyncio.Lock()
+        # Repeated questions (and lookup followed by store) reuse one encoding
+        self._embed = lru_cache(maxsize=EMBEDDING_CACHE_SIZE)(self._encode)
+
+    def _encode(self, text: str) -> np.ndarray:
+        """
+        Embed a single question as a normalized float32 row vector.
+
+        The returned array is shared by the memoized encoder, so it is read-only.
+
+        Args:
+            text (str): The question to embed
+
+        Returns:
+            np.ndarray: Embedding of shape (1, dimension)
+        """
+        embedding = self.model.encode([text], normalize_embeddings=True, convert_to_numpy=True)
+        embedding = embedding.astype(np.float32, copy=False)
+        embedding.setflags(write=False)
+        return embedding
+
+    def _evict(self, now: float) -> None:
+        """
+        Remove expired entries, and the oldest ones beyond the size limit.
+        Must be called with the lock held.
+
+        Args:
+            now (float): Current monotonic time
+        """
+        evicted = []
+        for entry_id, (stored_at, _) in self.entries.items():
+            if now - stored_at < self.ttl and len(self.entries) - len(evicted) < self.max_entries:
+                break
+            evicted.append(entry_id)
+
+        if evicted:
+            self.index.remove_ids(np.array(evicted, dtype=np.int64))
+            for entry_id in evicted:
+                del self.entries[entry_id]
+
+    async def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached response for a semantically similar question.
+
+        Embedding and search run in worker threads to keep the event loop free.
+
+        Args:
+            query (str): The user's natural language question
+
+        Returns:
+            Optional[Dict[str, Any]]: The cached response, or None on a cache miss
+        """
+        embedding = await asyncio.to_thread(self._embed, query)
+
+        async with self._lock:
+            if self.index.ntotal == 0:
+                return None
+
+            scores, ids = await asyncio.to_thread(self.index.search, embedding, 1)
+            entry = self.entries.get(int(ids[0][0]))
+            if entry is None or scores[0][0] < self.threshold:
+                return None
+
+            stored_at, response = entry
+            if time.monotonic() - stored_at >= self.ttl:
+                return None
+            return response
+
+    async def store(self, query: str, response: Dict[str, Any]) -> None:
+        """
+        Add a question and its generated response to the cache.
+
+        Args:
+            query (str): The user's natural language question
+            response (Dict[str, Any]): The response generated for the question
+        """
+        embedding = await asyncio.to_thread(self._embed, query)
+
+        async with self._lock:
+            now = time.monotonic()
+            # Make room first, so the index never exceeds max_entries
+            self._evict(now)
+            entry_id = next(self._ids)
+            await asyncio.to_thread(self.index.add_with_ids, embedding, np.array([entry_id], dtype=np.int64))
+            self.entries[entry_id] = (now, response)
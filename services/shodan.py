@@ -8,7 +8,9 @@ Author: Shovon Paul
 Date: 2024-11-17
 """
 
+import asyncio
 import shodan
+from async_lru import alru_cache
 from typing import Dict, Any, List
 from fastapi import HTTPException
 import os
@@ -24,10 +26,18 @@ if not SHODAN_API_KEY:
 
 api = shodan.Shodan(SHODAN_API_KEY)
 
+# Shared fallback for matches without location data; never mutated
+EMPTY = {}
+
+# Results for the same query are stable for minutes, so cache them briefly
+@alru_cache(maxsize=1024, ttl=300)
 async def execute_shodan_query(query: str, limit: int = 5) -> List[Dict[str, Any]]:
     """
     Execute a Shodan query and return formatted results.
 
+    Results are cached per (query, limit) for five minutes. Callers share
+    the cached list and must not modify it.
+
     Args:
         query (str): The Shodan query to execute
         limit (int): Number of results to return (default: 5)
@@ -39,18 +49,19 @@ async def execute_shodan_query(query: str, limit: int = 5) -> List[Dict[str, Any
         HTTPException: If there's an error executing the query
     """
     try:
-        # Execute Shodan search with user-specified limit
-        results = api.search(query, limit=limit)
+        # Execute Shodan search with user-specified limit; the client is
+        # synchronous, so run it in a worker thread to keep the event loop free
+        results = await asyncio.to_thread(api.search, query, limit=limit)
         
         # Format the results
         formatted_results = []
         for result in results['matches']:
+            loc = result.get('location') or EMPTY
             formatted_result = {
                 'ip': result.get('ip_str', 'N/A'),
                 'port': result.get('port', 'N/A'),
                 'organization': result.get('org', 'N/A'),
-                'location': f"{result.get('location', {}).get('country_name', 'N/A')}, "
-                          f"{result.get('location', {}).get('city', 'N/A')}",
+                'location': f"{loc.get('country_name', 'N/A')}, {loc.get('city', 'N/A')}",
                 'timestamp': result.get('timestamp', 'N/A'),
                 'product': result.get('product', 'N/A'),
                 'version': result.get('version', 'N/A'),
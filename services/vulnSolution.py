@@ -8,22 +8,18 @@ Author: Shovon Paul
 Date: 2024-11-17
 """
 
-from openai import AsyncOpenAI
-from typing import Dict, List, Any
+import asyncio
+from typing import Dict, List, Any, Optional
 from fastapi import HTTPException
 import os
+import json
+import re
 from dotenv import load_dotenv
+from services.openaiClient import client, OPENAI_MODEL
 
 # Load environment variables
 load_dotenv()
 
-# Initialize AsyncOpenAI client
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
-
-client = AsyncOpenAI(api_key=api_key)
-
 SOLUTION_SYSTEM_PROMPT = """You are a cybersecurity expert. Analyze the provided system details 
 and provide a detailed, step-by-step solution to address the identified vulnerabilities and security issues.
 Focus on:
@@ -34,6 +30,113 @@ Focus on:
 
 Keep your response concise but actionable, with clear steps."""
 
+SOLUTION_SYSTEM_MESSAGE = {"role": "system", "content": SOLUTION_SYSTEM_PROMPT}
+
+# Maximum number of solution requests in flight at once, to respect OpenAI rate limits
+MAX_CONCURRENT_SOLUTIONS = int(os.getenv("MAX_CONCURRENT_SOLUTIONS", "8"))
+
+FALLBACK_SOLUTION = "Unable to generate solution for this result."
+
+# Results analyzed per combined prompt; 8 x 500 completion tokens stays within the model's output limit
+SYSTEMS_PER_PROMPT = 8
+SOLUTION_MAX_TOKENS = 500
+
+# Per-system details shared by single and combined solution prompts
+SYSTEM_DETAILS_TEMPLATE = "Product: {product} {version}\nPort: {port}\n{vulns}"
+
+# Section headers the model is asked to emit in combined replies, e.g. "### SYSTEM 2"
+SYSTEM_SECTION_PATTERN = re.compile(r"^[ \t*]*#+[ \t]*SYSTEM[ \t]+(\d+)\b.*$", re.IGNORECASE | re.MULTILINE)
+
+# Batch API polling: start at 5 seconds and back off exponentially up to 5 minutes
+BATCH_POLL_INITIAL_DELAY = 5
+BATCH_POLL_MAX_DELAY = 300
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def format_system_details(result: Dict[str, Any]) -> str:
+    """
+    Describe a single Shodan result for the solution prompt.
+
+    Args:
+        result (Dict[str, Any]): Single Shodan result
+
+    Returns:
+        str: Product, port and vulnerability lines for the result
+    """
+    vulns_line = f"Vulnerabilities: {', '.join(result['vulns'])}\n" if result['vulns'] else ""
+    return SYSTEM_DETAILS_TEMPLATE.format_map({**result, "vulns": vulns_line})
+
+def build_solution_request(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the chat completion request body for a single Shodan result.
+
+    Args:
+        result (Dict[str, Any]): Single Shodan result
+
+    Returns:
+        Dict[str, Any]: Keyword arguments for a chat completion request
+    """
+    # Format the single result for analysis
+    analysis_prompt = "Analyze this system and provide specific solutions:\n" + format_system_details(result)
+
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [SOLUTION_SYSTEM_MESSAGE, {"role": "user", "content": analysis_prompt}],
+        "temperature": 0.7,
+        "max_tokens": SOLUTION_MAX_TOKENS
+    }
+
+def build_combined_solution_request(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build one chat completion request body covering several Shodan results.
+
+    Args:
+        results (List[Dict[str, Any]]): Shodan results to analyze together
+
+    Returns:
+        Dict[str, Any]: Keyword arguments for a chat completion request
+    """
+    analysis_prompt = (
+        "Analyze each system below and provide specific solutions. "
+        "Write one solution block per system, in the same order, each starting "
+        "with its header line exactly as given (for example '### SYSTEM 1').\n"
+    )
+    analysis_prompt += "".join(
+        f"\n### SYSTEM {idx}\n{format_system_details(result)}"
+        for idx, result in enumerate(results, start=1)
+    )
+
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [SOLUTION_SYSTEM_MESSAGE, {"role": "user", "content": analysis_prompt}],
+        "temperature": 0.7,
+        "max_tokens": SOLUTION_MAX_TOKENS * len(results)
+    }
+
+def split_combined_solution(reply: str, count: int) -> Optional[List[str]]:
+    """
+    Split a combined reply into per-system solutions.
+
+    Args:
+        reply (str): The model's reply to a combined request
+        count (int): Number of systems in the request
+
+    Returns:
+        Optional[List[str]]: One solution per system in order, or None if any section
+        is missing, empty, repeated or numbered out of range
+    """
+    # re.split yields [preamble, number, body, number, body, ...]
+    parts = SYSTEM_SECTION_PATTERN.split(reply)
+    sections: Dict[int, str] = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        idx = int(number)
+        # A repeated header (e.g. a sub-heading naming the system) makes the split ambiguous
+        if idx in sections or not 1 <= idx <= count:
+            return None
+        sections[idx] = body.strip()
+    if len(sections) != count or not all(sections.values()):
+        return None
+    return [sections[idx] for idx in range(1, count + 1)]
+
 async def get_security_solution_for_result(result: Dict[str, Any]) -> str:
     """
     Generate security solution for a single Shodan result.
@@ -45,35 +148,46 @@ async def get_security_solution_for_result(result: Dict[str, Any]) -> str:
         str: Detailed security solution for the specific result
     """
     try:
-        # Format the single result for analysis
-        analysis_prompt = (
-            f"Analyze this system and provide specific solutions:\n"
-            f"Product: {result['product']} {result['version']}\n"
-            f"Port: {result['port']}\n"
-        )
-        if result['vulns']:
-            analysis_prompt += f"Vulnerabilities: {', '.join(result['vulns'])}\n"
-
         # Get solution from ChatGPT
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {"role": "system", "content": SOLUTION_SYSTEM_PROMPT},
-                {"role": "user", "content": analysis_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
+        response = await client.chat.completions.create(**build_solution_request(result))
 
         return response.choices[0].message.content
 
     except Exception as e:
         print(f"Error generating solution for result: {str(e)}")
-        return "Unable to generate solution for this result."
+        return FALLBACK_SOLUTION
+
+async def get_combined_security_solutions(results: List[Dict[str, Any]]) -> Optional[List[str]]:
+    """
+    Generate security solutions for several Shodan results with a single request.
 
-async def get_security_solutions(shodan_results: List[Dict[str, Any]]) -> List[str]:
+    Args:
+        results (List[Dict[str, Any]]): Shodan results to analyze together
+
+    Returns:
+        Optional[List[str]]: Solutions in result order, or None if the reply was
+        truncated or could not be split into one section per result
+    """
+    try:
+        response = await client.chat.completions.create(**build_combined_solution_request(results))
+
+        # A reply cut off at max_tokens would pass off a partial last section as complete
+        choice = response.choices[0]
+        if choice.finish_reason == "length":
+            return None
+
+        return split_combined_solution(choice.message.content or "", len(results))
+
+    except Exception as e:
+        print(f"Error generating combined solution for results: {str(e)}")
+        return [FALLBACK_SOLUTION] * len(results)
+
+async def get_security_solutions_batch(shodan_results: List[Dict[str, Any]]) -> List[str]:
     """
-    Generate security solutions for each Shodan result.
+    Generate security solutions for all Shodan results through the OpenAI Batch API.
+
+    Batch requests are billed at a discount but may take up to 24 hours to
+    complete, so this is intended for offline evaluation runs, not /query.
 
     Args:
         shodan_results (List[Dict[str, Any]]): List of formatted Shodan results
@@ -82,16 +196,115 @@ async def get_security_solutions(shodan_results: List[Dict[str, Any]]) -> List[s
         List[str]: List of security solutions corresponding to each result
 
     Raises:
-        HTTPException: If there's an error generating solutions
+        HTTPException: If the batch could not be submitted or retrieved
     """
+    if not shodan_results:
+        return []
+
     try:
-        solutions = []
-        for result in shodan_results:
-            solution = await get_security_solution_for_result(result)
-            solutions.append(solution)
-            
+        # One JSONL request per result; custom_id maps responses back to positions
+        batch_input = "\n".join(
+            json.dumps({
+                "custom_id": str(idx),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": build_solution_request(result)
+            })
+            for idx, result in enumerate(shodan_results)
+        )
+        input_file = await client.files.create(
+            file=("security_solutions.jsonl", batch_input.encode("utf-8")),
+            purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+
+        # Poll until the batch finishes, backing off exponentially
+        delay = BATCH_POLL_INITIAL_DELAY
+        while batch.status not in BATCH_TERMINAL_STATUSES:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BATCH_POLL_MAX_DELAY)
+            batch = await client.batches.retrieve(batch.id)
+
+        solutions = [FALLBACK_SOLUTION] * len(shodan_results)
+        if not batch.output_file_id:
+            print(f"Solution batch {batch.id} ended with status: {batch.status}")
+            return solutions
+
+        output = await client.files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                solutions[int(record["custom_id"])] = response["body"]["choices"][0]["message"]["content"]
+
         return solutions
 
+    except Exception as e:
+        print(f"Error generating batch security solutions: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error generating batch security solutions: {str(e)}"
+        )
+
+async def get_security_solutions(shodan_results: List[Dict[str, Any]], use_batch: bool = False) -> List[str]:
+    """
+    Generate security solutions for the Shodan results concurrently.
+
+    Results are analyzed SYSTEMS_PER_PROMPT at a time in a single combined
+    request. A group whose reply is missing sections falls back to one
+    request per result.
+
+    Args:
+        shodan_results (List[Dict[str, Any]]): List of formatted Shodan results
+        use_batch (bool): Submit through the OpenAI Batch API instead of interactive requests
+
+    Returns:
+        List[str]: List of security solutions corresponding to each result
+
+    Raises:
+        HTTPException: If there's an error generating solutions
+    """
+    if use_batch:
+        return await get_security_solutions_batch(shodan_results)
+
+    try:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_SOLUTIONS)
+
+        async def bounded_solution(result: Dict[str, Any]) -> str:
+            async with semaphore:
+                return await get_security_solution_for_result(result)
+
+        async def group_solutions(group: List[Dict[str, Any]]) -> List[str]:
+            if len(group) > 1:
+                async with semaphore:
+                    solutions = await get_combined_security_solutions(group)
+                if solutions is not None:
+                    return solutions
+            return await asyncio.gather(*(bounded_solution(result) for result in group))
+
+        groups = [
+            shodan_results[start:start + SYSTEMS_PER_PROMPT]
+            for start in range(0, len(shodan_results), SYSTEMS_PER_PROMPT)
+        ]
+
+        # Request all groups concurrently; gather preserves result order
+        group_results = await asyncio.gather(
+            *(group_solutions(group) for group in groups),
+            return_exceptions=True
+        )
+
+        return [
+            solution
+            for group, solutions in zip(groups, group_results)
+            for solution in (
+                [FALLBACK_SOLUTION] * len(group) if isinstance(solutions, Exception) else solutions
+            )
+        ]
+
     except Exception as e:
         print(f"Error generating security solutions: {str(e)}")
         raise HTTPException(
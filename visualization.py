@@ -8,6 +8,8 @@ Author: Shovon Paul
 Date: 2024-11-17
 """
 
+import matplotlib
+matplotlib.use('Agg')  # Render straight to files; skip GUI backend initialization
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
@@ -16,6 +18,23 @@ from pathlib import Path
 from typing import Dict, List
 import numpy as np
 from datetime import datetime
+from functools import lru_cache
+
+# Component timing columns, in plotting order
+COMPONENT_COLUMNS = ['ChatGPT Time', 'Shodan Time', 'Solution Time']
+
+@lru_cache(maxsize=4)
+def _load_results(csv_path: Path, csv_mtime: float, json_path: Path, json_mtime: float) -> tuple[pd.DataFrame, Dict]:
+    """
+    Parse a results CSV and analysis JSON, memoized on path and modification time.
+
+    The mtimes are part of the cache key only, so a rewritten file is parsed again.
+    Callers share the returned objects and must not modify them.
+    """
+    df = pd.read_csv(csv_path)
+    with open(json_path, 'r') as f:
+        analysis = json.load(f)
+    return df, analysis
 
 class PerformanceVisualizer:
     def __init__(self, results_dir: str = "evaluation_results"):
@@ -46,21 +65,20 @@ class PerformanceVisualizer:
         if not csv_files or not json_files:
             raise FileNotFoundError("No results files found in the specified directory")
             
-        latest_csv = max(csv_files, key=lambda x: x.stat().st_mtime)
-        latest_json = max(json_files, key=lambda x: x.stat().st_mtime)
+        csv_mtime, latest_csv = max((f.stat().st_mtime, f) for f in csv_files)
+        json_mtime, latest_json = max((f.stat().st_mtime, f) for f in json_files)
         
         print(f"Loading data from:\n{latest_csv}\n{latest_json}")  # Debug print
         
-        # Load data
-        df = pd.read_csv(latest_csv)
-        with open(latest_json, 'r') as f:
-            analysis = json.load(f)
-            
-        return df, analysis
+        # Load data, reusing the parsed files if they have not changed
+        return _load_results(latest_csv, csv_mtime, latest_json, json_mtime)
 
-    def create_time_distribution_plot(self, df: pd.DataFrame) -> None:
+    def create_time_distribution_plot(self, times: np.ndarray) -> None:
         """
         Create a violin plot showing the distribution of response times.
+
+        Args:
+            times (np.ndarray): Component times, shape (N, 3) in COMPONENT_COLUMNS order
         """
         # Clear any existing plots and set figure size
         plt.clf()
@@ -75,12 +93,17 @@ class PerformanceVisualizer:
                 'ytick.labelsize': 24
             })
             
-            # Melt the DataFrame for seaborn
-            df_melted = pd.melt(df, value_vars=['ChatGPT Time', 'Shodan Time', 'Solution Time'],
-                               var_name='Component', value_name='Time (seconds)')
-            
-            # Create violin plot with larger scale
-            ax = sns.violinplot(data=df_melted, x='Component', y='Time (seconds)', scale='width')
+            # Create violin plot directly in matplotlib; each column of the array is one component
+            ax = plt.gca()
+            positions = np.arange(1, len(COMPONENT_COLUMNS) + 1)
+            parts = ax.violinplot(times, positions=positions, widths=0.8, showmeans=True)
+            for body, color in zip(parts['bodies'], sns.color_palette()):
+                body.set_facecolor(color)
+                body.set_alpha(0.8)
+            for key in ('cbars', 'cmins', 'cmaxes', 'cmeans'):
+                parts[key].set_color('0.25')
+            ax.set_xticks(positions)
+            ax.set_xticklabels(COMPONENT_COLUMNS)
             
             # Customize the plot without title
             plt.xlabel('Component', labelpad=15, fontsize=28, fontweight='bold')
@@ -90,21 +113,24 @@ class PerformanceVisualizer:
             # Increase tick label sizes
             ax.tick_params(axis='both', which='major', labelsize=24)
             
-            # Adjust layout with more space
-            plt.tight_layout()
+            # Adjust layout with more space; this sets the saved margins
+            plt.tight_layout(pad=1.0)
             
             # Save plot with higher DPI
             output_path = self.results_dir / f'time_distribution_{datetime.now():%Y%m%d_%H%M%S}.png'
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
+            plt.savefig(output_path, dpi=300)
             print(f"Saved time distribution plot to: {output_path}")
             plt.close()
         except Exception as e:
             print(f"Error creating time distribution plot: {str(e)}")
             plt.close()
 
-    def create_component_breakdown_plot(self, df: pd.DataFrame) -> None:
+    def create_component_breakdown_plot(self, times: np.ndarray) -> None:
         """
         Create a stacked bar plot showing the breakdown of component times.
+
+        Args:
+            times (np.ndarray): Component times, shape (N, 3) in COMPONENT_COLUMNS order
         """
         # Clear any existing plots and set figure size
         plt.clf()
@@ -121,16 +147,16 @@ class PerformanceVisualizer:
             })
             
             # Calculate means for each component
-            means = df[['ChatGPT Time', 'Shodan Time', 'Solution Time']].mean()
+            means = times.mean(axis=0)
             
             # Create stacked bar plot
             bottom = 0
             colors = ['#FF9999', '#66B2FF', '#99FF99']
             
-            for component, color in zip(means.index, colors):
-                plt.bar('Total Response Time', means[component], bottom=bottom, 
+            for component, mean, color in zip(COMPONENT_COLUMNS, means, colors):
+                plt.bar('Total Response Time', mean, bottom=bottom, 
                        label=component, color=color)
-                bottom += means[component]
+                bottom += mean
             
             plt.ylabel('Time (seconds)', labelpad=15, fontsize=28, fontweight='bold')
             
@@ -149,12 +175,12 @@ class PerformanceVisualizer:
             plt.xticks(fontsize=24)
             plt.yticks(fontsize=24)
             
-            # Adjust layout
-            plt.tight_layout()
+            # Adjust layout; this sets the saved margins
+            plt.tight_layout(pad=1.0)
             
             # Save plot with higher DPI
             output_path = self.results_dir / f'component_breakdown_{datetime.now():%Y%m%d_%H%M%S}.png'
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
+            plt.savefig(output_path, dpi=300)
             print(f"Saved component breakdown plot to: {output_path}")
             plt.close()
         except Exception as e:
@@ -203,12 +229,12 @@ class PerformanceVisualizer:
             plt.xticks(fontsize=24, rotation=0)
             plt.yticks(fontsize=24)
             
-            # Adjust layout
-            plt.tight_layout()
+            # Adjust layout; this sets the saved margins
+            plt.tight_layout(pad=1.0)
             
             # Save plot with higher DPI
             output_path = self.results_dir / f'performance_summary_{datetime.now():%Y%m%d_%H%M%S}.png'
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
+            plt.savefig(output_path, dpi=300)
             print(f"Saved performance summary plot to: {output_path}")
             plt.close()
         except Exception as e:
@@ -223,9 +249,12 @@ class PerformanceVisualizer:
             print("Loading evaluation results...")
             df, analysis = self.load_latest_results()
             
+            # Extract the component columns once as a contiguous (N, 3) array
+            times = df[COMPONENT_COLUMNS].to_numpy(dtype=np.float64)
+            
             print("Generating visualizations...")
-            self.create_time_distribution_plot(df)
-            self.create_component_breakdown_plot(df)
+            self.create_time_distribution_plot(times)
+            self.create_component_breakdown_plot(times)
             self.create_performance_summary(analysis)
             
             print(f"Visualizations saved in: {self.results_dir}")